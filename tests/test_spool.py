@@ -0,0 +1,237 @@
+import asyncio
+import json
+import pytest
+import async_functions
+import spool
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import DataError, OperationalError
+
+
+def weather_response(city_id, dt=1700000000):
+    """
+    Builds a minimal OpenWeatherMap API response for the given city.
+    """
+    return {
+        "id": city_id,
+        "name": f"City {city_id}",
+        "dt": dt,
+        "coord": {"lon": 25.28, "lat": 54.69},
+        "weather": [{"main": "Clear", "description": "clear sky"}],
+        "main": {"temp": 10.0, "feels_like": 9.0, "temp_min": 8.0, "temp_max": 12.0, "pressure": 1015, "humidity": 70},
+        "wind": {"speed": 3.5, "deg": 180},
+        "sys": {"country": "LT"},
+    }
+
+
+class FakeDatabase:
+    """
+    Records the batches passed to insert_weather_batch, optionally failing the first few commits.
+    """
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.city_ids = []
+
+    async def insert_weather_batch(self, weather_rows, session):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        self.city_ids.extend(row.city_id for row in weather_rows)
+        return len(weather_rows)
+
+
+class RejectingSession:
+    """
+    Session double that commits inserted city ids and raises the given error for any statement
+    containing the rejected city id.
+    """
+    def __init__(self, rejected_city_id, error):
+        self.rejected_city_id = rejected_city_id
+        self.error = error
+        self.pending = []
+        self.city_ids = []
+
+    async def execute(self, statement):
+        params = statement.compile(dialect=mysql.dialect()).params
+        city_ids = [params[key] for key in sorted(
+            (key for key in params if key.startswith("city_id_m")), key=lambda key: int(key[len("city_id_m"):])
+        )]
+        if self.rejected_city_id in city_ids:
+            raise self.error
+        self.pending = city_ids
+
+    async def commit(self):
+        self.city_ids.extend(self.pending)
+        self.pending = []
+
+    async def rollback(self):
+        self.pending = []
+
+
+@pytest.fixture
+def database(monkeypatch):
+    fake_database = FakeDatabase()
+    monkeypatch.setattr(spool, "insert_weather_batch", fake_database.insert_weather_batch)
+    return fake_database
+
+
+def drain(spool_dir, batch_size=100):
+    return asyncio.run(spool.drain_spool(spool_dir, session=None, batch_size=batch_size))
+
+
+def segment_names(spool_dir):
+    return sorted(path.name for path in spool_dir.glob("segment-*.log"))
+
+
+def test_drain_inserts_spooled_records_in_order(tmp_path, database):
+    spool.append_to_spool(tmp_path, [weather_response(i) for i in range(5)], 1 << 20)
+
+    assert drain(tmp_path, batch_size=2) == 5
+    assert database.city_ids == [0, 1, 2, 3, 4]
+    assert drain(tmp_path) == 0
+
+
+def test_failed_commit_does_not_advance_checkpoint(tmp_path, database):
+    spool.append_to_spool(tmp_path, [weather_response(i) for i in range(4)], 1 << 20)
+    database.failures = 1
+
+    with pytest.raises(RuntimeError):
+        drain(tmp_path, batch_size=2)
+    assert spool.read_checkpoint(tmp_path) == (0, 0)
+
+    assert drain(tmp_path, batch_size=2) == 4
+    assert database.city_ids == [0, 1, 2, 3]
+
+
+def test_failed_later_batch_keeps_earlier_checkpoint(tmp_path, database, monkeypatch):
+    spool.append_to_spool(tmp_path, [weather_response(i) for i in range(4)], 1 << 20)
+    calls = []
+
+    async def fail_second_batch(weather_rows, session):
+        calls.append([row.city_id for row in weather_rows])
+        if len(calls) == 2:
+            raise RuntimeError("database unavailable")
+        return len(weather_rows)
+
+    monkeypatch.setattr(spool, "insert_weather_batch", fail_second_batch)
+    with pytest.raises(RuntimeError):
+        drain(tmp_path, batch_size=2)
+
+    monkeypatch.setattr(spool, "insert_weather_batch", database.insert_weather_batch)
+    assert drain(tmp_path, batch_size=2) == 2
+    assert database.city_ids == [2, 3]
+
+
+def test_torn_trailing_record_is_ignored_and_truncated(tmp_path, database):
+    spool.append_to_spool(tmp_path, [weather_response(1)], 1 << 20)
+    segment_path = tmp_path / segment_names(tmp_path)[0]
+    intact_size = segment_path.stat().st_size
+    with open(segment_path, "ab") as segment:
+        segment.write(b'{"id":2,"na')
+
+    assert [record[2]["id"] for record in spool.read_pending(tmp_path)] == [1]
+
+    spool.append_to_spool(tmp_path, [weather_response(3)], 1 << 20)
+    lines = segment_path.read_bytes().splitlines()
+    assert len(lines[0]) + 1 == intact_size
+    assert [json.loads(line)["id"] for line in lines] == [1, 3]
+
+    assert drain(tmp_path) == 2
+    assert database.city_ids == [1, 3]
+
+
+def test_segments_rotate_at_max_bytes(tmp_path, database):
+    spool.append_to_spool(tmp_path, [weather_response(1)], 1)
+    spool.append_to_spool(tmp_path, [weather_response(2)], 1)
+    spool.append_to_spool(tmp_path, [weather_response(3)], 1 << 20)
+
+    assert segment_names(tmp_path) == ["segment-00000001.log", "segment-00000002.log"]
+    assert [record[2]["id"] for record in spool.read_pending(tmp_path)] == [1, 2, 3]
+
+
+def test_checkpoint_advances_past_corrupt_and_non_weather_records(tmp_path, database):
+    spool.append_to_spool(tmp_path, [{"cod": "404", "message": "city not found"}], 1 << 20)
+    segment_path = tmp_path / segment_names(tmp_path)[0]
+    with open(segment_path, "ab") as segment:
+        segment.write(b"not json\n")
+    spool.append_to_spool(tmp_path, [weather_response(7)], 1 << 20)
+
+    assert drain(tmp_path) == 1
+    assert database.city_ids == [7]
+    assert spool.read_checkpoint(tmp_path) == (1, segment_path.stat().st_size)
+
+
+def test_acknowledged_segments_are_removed(tmp_path, database):
+    spool.append_to_spool(tmp_path, [weather_response(1)], 1)
+    spool.append_to_spool(tmp_path, [weather_response(2)], 1)
+    spool.append_to_spool(tmp_path, [weather_response(3)], 1)
+
+    assert drain(tmp_path) == 3
+    assert segment_names(tmp_path) == ["segment-00000003.log"]
+
+
+def test_new_segment_starts_after_checkpoint_when_none_remain(tmp_path, database):
+    spool.write_checkpoint(tmp_path, 4, 1234)
+
+    spool.append_to_spool(tmp_path, [weather_response(1)], 1 << 20)
+
+    assert segment_names(tmp_path) == ["segment-00000005.log"]
+    assert drain(tmp_path) == 1
+    assert database.city_ids == [1]
+
+
+def test_corrupt_checkpoint_replays_from_oldest_segment(tmp_path, database, caplog):
+    spool.append_to_spool(tmp_path, [weather_response(1), weather_response(2)], 1 << 20)
+    (tmp_path / spool.CHECKPOINT_FILE).write_text("{\"segment\": 1")
+
+    assert drain(tmp_path) == 2
+    assert database.city_ids == [1, 2]
+    assert "checkpoint" in caplog.text and "corrupt" in caplog.text
+
+
+def test_drain_is_skipped_while_another_process_holds_the_lock(tmp_path, database):
+    spool.append_to_spool(tmp_path, [weather_response(1)], 1 << 20)
+
+    with spool._spool_lock(tmp_path, spool.DRAIN_LOCK_FILE, blocking=False) as acquired:
+        assert acquired
+        assert drain(tmp_path) is None
+        spool.append_to_spool(tmp_path, [weather_response(2)], 1 << 20)
+
+    assert database.city_ids == []
+    assert drain(tmp_path) == 2
+    assert database.city_ids == [1, 2]
+
+
+def test_insert_weather_batch_ignores_duplicate_rows():
+    class RecordingSession:
+        async def execute(self, statement):
+            self.statement = statement
+
+        async def commit(self):
+            self.committed = True
+
+    session = RecordingSession()
+    weather_rows = [async_functions.extract_weather_data(weather_response(i)) for i in range(2)]
+    asyncio.run(async_functions.insert_weather_batch(weather_rows, session))
+
+    sql = str(session.statement.compile(dialect=mysql.dialect()))
+    assert "ON DUPLICATE KEY UPDATE" in sql
+    assert session.committed
+
+
+def test_rejected_row_is_skipped_and_rest_of_batch_inserted(tmp_path):
+    spool.append_to_spool(tmp_path, [weather_response(i) for i in range(5)], 1 << 20)
+    session = RejectingSession(1, DataError("INSERT", {}, Exception("Data too long for column 'city_name'")))
+
+    assert asyncio.run(spool.drain_spool(tmp_path, session, batch_size=3)) == 4
+    assert session.city_ids == [0, 2, 3, 4]
+    assert asyncio.run(spool.drain_spool(tmp_path, session, batch_size=3)) == 0
+
+
+def test_connection_error_keeps_batch_in_spool(tmp_path):
+    spool.append_to_spool(tmp_path, [weather_response(i) for i in range(3)], 1 << 20)
+    session = RejectingSession(1, OperationalError("INSERT", {}, Exception("Lost connection to MySQL server")))
+
+    with pytest.raises(OperationalError):
+        asyncio.run(spool.drain_spool(tmp_path, session, batch_size=3))
+    assert session.city_ids == []
+    assert spool.read_checkpoint(tmp_path) == (0, 0)
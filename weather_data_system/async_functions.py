@@ -1,4 +1,6 @@
 import logging
+from sqlalchemy.dialects.mysql import insert
+from sqlalchemy.exc import DataError, IntegrityError
 from database_models import WeatherData
 from datetime import datetime, timezone
 
@@ -56,23 +58,73 @@ def extract_weather_data(api_response):
         rain_1h=rain.get("1h", None)
     )
 
-async def insert_weather_data(api_response, session):
+def _weather_insert_statement(weather_rows):
     """
-    Inserts weather data into the database asynchronously.
+    Builds a multi-row insert for the given weather data that leaves existing rows unchanged.
 
     Args:
-        api_response (dict): The JSON response from the weather API.
+        weather_rows (list): WeatherData instances to insert.
+
+    Returns:
+        Insert: MySQL insert statement with a no-op ON DUPLICATE KEY UPDATE clause.
+    """
+    columns = [column.name for column in WeatherData.__table__.columns if column.name != "index"]
+    values = [{column: getattr(row, column) for column in columns} for row in weather_rows]
+    statement = insert(WeatherData).values(values)
+    # No-op update turns duplicate key errors into skipped rows
+    return statement.on_duplicate_key_update(city_id=statement.inserted.city_id)
+
+async def insert_weather_data(weather_data, session):
+    """
+    Inserts a single row of weather data into the database asynchronously.
+
+    Args:
+        weather_data (WeatherData): The weather data to insert.
+        session (AsyncSession): The SQLAlchemy asynchronous session used for database operations.
+
+    Returns:
+        bool: True if the row was written, False if the database rejected it.
+
+    Raises:
+        SQLAlchemyError: Any database error other than the row being rejected, e.g. a lost connection.
+    """
+    try:
+        await session.execute(_weather_insert_statement([weather_data]))
+        await session.commit()
+        return True
+    except (DataError, IntegrityError) as e:
+        await session.rollback()
+        logging.error(f"Skipping weather data for city {weather_data.city_id} rejected by the database: {e}")
+        return False
+
+async def insert_weather_batch(weather_rows, session):
+    """
+    Inserts a batch of weather data into the database in a single statement and commits it.
+
+    Rows that already exist for the same city and timestamp are left unchanged, so replaying a batch
+    does not create duplicates. If the database rejects the batch because of a bad row, the rows are
+    inserted one at a time and the ones that still fail are logged and skipped.
+
+    Args:
+        weather_rows (list): WeatherData instances to insert.
         session (AsyncSession): The SQLAlchemy asynchronous session used for database operations.
 
-    Logs:
-        A success message if data is inserted correctly.
-        An error message if insertion fails.
+    Returns:
+        int: Number of rows written to the database.
+
+    Raises:
+        SQLAlchemyError: Any database error other than a row being rejected, e.g. a lost connection.
     """
     try:
-        weather_data = extract_weather_data(api_response)
-        session.add(weather_data)
+        await session.execute(_weather_insert_statement(weather_rows))
         await session.commit()
-        logging.info("Weather data inserted successfully!")
-    except Exception as e:
+        return len(weather_rows)
+    except (DataError, IntegrityError) as e:
         await session.rollback()
-        logging.error(f"Error inserting weather data: {e}")
+        logging.warning(f"Database rejected batch of {len(weather_rows)} weather records, inserting them one at a time: {e}")
+
+    inserted = 0
+    for weather_data in weather_rows:
+        if await insert_weather_data(weather_data, session):
+            inserted += 1
+    return inserted
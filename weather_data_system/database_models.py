@@ -1,5 +1,5 @@
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, String, Integer, Float, DateTime
+from sqlalchemy import Column, String, Integer, Float, DateTime, UniqueConstraint
 
 Base = declarative_base()
 
@@ -29,6 +29,9 @@ class WeatherData(Base):
         rain_1h (float): Rain volume for the last 1 hour, mm.
     """
     __tablename__ = "weather_data"
+    __table_args__ = (
+        UniqueConstraint("city_id", "timestamp", name="uq_weather_data_city_timestamp"),
+    )
 
     index = Column(Integer, primary_key=True, unique=True, index=True, autoincrement=True)
     city_id = Column(Integer, index=True)
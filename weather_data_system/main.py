@@ -5,8 +5,10 @@ import time
 from decouple import config
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy import create_engine
-from async_functions import get_weather_info, insert_weather_data
+from sqlalchemy.exc import SQLAlchemyError, OperationalError, InterfaceError
+from async_functions import get_weather_info
 from database_utils import initialize_database, create_tables, create_views
+from spool import append_to_spool, drain_spool
 from pathlib import Path
 
 async def main():
@@ -16,15 +18,20 @@ async def main():
     This function performs the following tasks:
     1. Sets up logging.
     2. Loads environment variables.
-    3. Creates synchronous and asynchronous database engines.
-    4. Initializes the database and creates tables and views.
-    5. Reads the list of cities and countries from a file.
-    6. Fetches weather data asynchronously for each city using the OpenWeatherMap API.
-    7. Inserts the collected weather data into the database.
+    3. Reads the list of cities and countries from a file.
+    4. Fetches weather data asynchronously for each city using the OpenWeatherMap API.
+    5. Appends the fetched weather data to the local spool in SPOOL_DIR.
+    6. Creates synchronous and asynchronous database engines.
+    7. Initializes the database and creates tables and views.
+    8. Drains the spool into the database, including records left over from earlier runs.
+
+    The drain runs in the same process and is limited to SPOOL_DRAIN_TIMEOUT seconds. If the database is
+    unavailable or too slow, or another run is already draining, the remaining data stays in the spool
+    and is inserted on a later run.
 
     Raises:
         IOError: If there is an issue reading the cities file specified by CITIES_FILE_PATH.
-        Exception: Any exception raised during weather data insertion or the main program execution.
+        Exception: Any exception raised while fetching or spooling weather data, or during the main program execution.
     """
     LOGS_FILE_PATH = config('LOGS_FILE_PATH')
     # Set up logging
@@ -41,18 +48,12 @@ async def main():
     CONNECTION_STRING_ASYNC = config('CONNECTION_STRING_ASYNC')
     API_KEY = config('API_KEY')
     CITIES_FILE_PATH = config('CITIES_FILE_PATH')
+    SPOOL_DIR = config('SPOOL_DIR')
+    SPOOL_SEGMENT_MAX_BYTES = config('SPOOL_SEGMENT_MAX_BYTES', default=16 * 1024 * 1024, cast=int)
+    SPOOL_BATCH_SIZE = config('SPOOL_BATCH_SIZE', default=500, cast=int)
+    SPOOL_DRAIN_TIMEOUT = config('SPOOL_DRAIN_TIMEOUT', default=240, cast=float)
     logging.info("Loaded environment variables.")
 
-    # Create engines
-    engine = create_engine(CONNECTION_STRING)
-    async_engine = create_async_engine(CONNECTION_STRING_ASYNC, echo=True)
-    logging.info("Created database engines.")
-
-    # Create database synchronously and tables asynchronously
-    initialize_database(engine)
-    await create_tables(async_engine)
-    await create_views(async_engine)
-
     # Read cities from the file
     city_country_pairs = []
     cities_file_path = Path(CITIES_FILE_PATH)
@@ -67,7 +68,7 @@ async def main():
         logging.error(f"File I/O error: {e}")
         return
 
-    # Fetch and insert weather data
+    # Fetch weather data
     async with aiohttp.ClientSession() as session:
         tasks = []
         for city, country in city_country_pairs:
@@ -82,20 +83,44 @@ async def main():
             logging.error(f"Error occurred while fetching weather data: {e}")
             raise
 
-        # Insert weather data into the database asynchronously
+    # Persist fetched data before touching the database so it survives a database outage
+    append_to_spool(SPOOL_DIR, weather_responses, SPOOL_SEGMENT_MAX_BYTES)
+
+    # Create engines
+    engine = create_engine(CONNECTION_STRING)
+    async_engine = create_async_engine(CONNECTION_STRING_ASYNC, echo=True)
+    logging.info("Created database engines.")
+
+    drained = False
+    try:
+        # Create database synchronously and tables asynchronously
+        initialize_database(engine)
+        await create_tables(async_engine)
+        await create_views(async_engine)
+
+        # Insert spooled weather data, bounded so a slow database cannot stretch this run into the next one
         async with AsyncSession(bind=async_engine) as db_session:
-            try:
-                for weather in weather_responses:
-                    await insert_weather_data(weather, db_session)
-            except Exception as e:
-                await db_session.rollback()
-                logging.error(f"Error during weather data insertion: {e}")
-            finally:
-                await db_session.close()
+            inserted = await asyncio.wait_for(
+                drain_spool(SPOOL_DIR, db_session, SPOOL_BATCH_SIZE), timeout=SPOOL_DRAIN_TIMEOUT
+            )
+        if inserted is not None:
+            logging.info(f"Inserted {inserted} spooled weather records.")
+            drained = True
+    except TimeoutError:
+        logging.warning(f"Spool drain exceeded {SPOOL_DRAIN_TIMEOUT} seconds, remaining data kept in spool.")
+    except (OperationalError, InterfaceError) as e:
+        logging.error(f"Database unavailable, data kept in spool: {e}")
+    except SQLAlchemyError as e:
+        logging.error(f"Database error while inserting weather data, data kept in spool: {e}")
+    except Exception as e:
+        logging.error(f"Error while draining spool in {SPOOL_DIR}, data kept in spool: {e}")
 
     await async_engine.dispose()
     engine.dispose()
-    logging.info("Program completed successfully.")
+    if drained:
+        logging.info("Program completed successfully.")
+    else:
+        logging.warning("Program completed, but weather data is waiting in the spool for a later run.")
 
 if __name__ == "__main__":
     start_time = time.time()
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from async_functions import extract_weather_data, insert_weather_batch
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CHECKPOINT_FILE = "checkpoint.json"
+APPEND_LOCK_FILE = "append.lock"
+DRAIN_LOCK_FILE = "drain.lock"
+
+def _segment_path(spool_dir, sequence):
+    """
+    Builds the path of a spool segment file from its sequence number.
+
+    Args:
+        spool_dir (Path): Directory holding the spool segments.
+        sequence (int): Sequence number of the segment.
+
+    Returns:
+        Path: Path of the segment file.
+    """
+    return spool_dir / f"{SEGMENT_PREFIX}{sequence:08d}{SEGMENT_SUFFIX}"
+
+def _list_segments(spool_dir):
+    """
+    Lists the sequence numbers of all segments in the spool directory.
+
+    Args:
+        spool_dir (Path): Directory holding the spool segments.
+
+    Returns:
+        list: Sorted list of segment sequence numbers.
+    """
+    sequences = []
+    for path in spool_dir.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"):
+        try:
+            sequences.append(int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        except ValueError:
+            logging.warning(f"Ignoring unexpected file in spool directory: {path.name}")
+    return sorted(sequences)
+
+def _fsync_directory(spool_dir):
+    """
+    Flushes directory metadata (file creation, rename) to disk where the platform supports it.
+
+    Args:
+        spool_dir (Path): Directory to flush.
+    """
+    if os.name != "posix":
+        return
+    dir_fd = os.open(spool_dir, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+@contextmanager
+def _spool_lock(spool_dir, lock_name, blocking):
+    """
+    Holds an exclusive lock on a lock file in the spool directory for the duration of the block.
+
+    Args:
+        spool_dir (Path): Directory holding the spool segments.
+        lock_name (str): Name of the lock file.
+        blocking (bool): Whether to wait for the lock instead of giving up when another process holds it.
+
+    Yields:
+        bool: True if the lock was acquired, False if it is held by another process.
+    """
+    with open(spool_dir / lock_name, "a+") as lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            if blocking:
+                raise
+            yield False
+            return
+        # Closing the file releases the lock
+        yield True
+
+def _repair_tail(path):
+    """
+    Truncates a partially written record left at the end of a segment by an interrupted write.
+
+    Args:
+        path (Path): Path of the segment file.
+    """
+    with open(path, "rb+") as segment:
+        data = segment.read()
+        if not data or data.endswith(b"\n"):
+            return
+        last_newline = data.rfind(b"\n")
+        segment.truncate(last_newline + 1)
+        segment.flush()
+        os.fsync(segment.fileno())
+    logging.warning(f"Truncated incomplete record at the end of spool segment {path.name}.")
+
+def read_checkpoint(spool_dir):
+    """
+    Reads the position up to which spooled records have been acknowledged by the database.
+
+    A missing checkpoint, or one that cannot be parsed, restarts from the oldest segment. Replayed
+    records that were already inserted are ignored by the database.
+
+    Args:
+        spool_dir (Path): Directory holding the spool segments.
+
+    Returns:
+        tuple: (segment sequence, byte offset) of the first unacknowledged record.
+    """
+    checkpoint_path = spool_dir / CHECKPOINT_FILE
+    try:
+        with open(checkpoint_path, "r") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        return int(checkpoint["segment"]), int(checkpoint["offset"])
+    except FileNotFoundError:
+        return 0, 0
+    except (ValueError, KeyError, TypeError) as e:
+        logging.error(f"Spool checkpoint {checkpoint_path} is corrupt, replaying spool from the oldest segment: {e}")
+        return 0, 0
+
+def write_checkpoint(spool_dir, sequence, offset):
+    """
+    Atomically records the position up to which spooled records have been acknowledged.
+
+    Args:
+        spool_dir (Path): Directory holding the spool segments.
+        sequence (int): Segment sequence number of the first unacknowledged record.
+        offset (int): Byte offset of the first unacknowledged record within that segment.
+    """
+    checkpoint_path = spool_dir / CHECKPOINT_FILE
+    temp_path = checkpoint_path.with_suffix(".tmp")
+    with open(temp_path, "w") as checkpoint_file:
+        json.dump({"segment": sequence, "offset": offset}, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temp_path, checkpoint_path)
+    _fsync_directory(spool_dir)
+
+def append_to_spool(spool_dir, api_responses, segment_max_bytes):
+    """
+    Appends API responses to the spool as compact JSON lines and fsyncs them as one batch.
+
+    A new segment is started once the current one reaches segment_max_bytes. Appends are serialized
+    with a lock that is independent of the drain lock, so a slow drain never holds up spooling.
+
+    Args:
+        spool_dir (str or Path): Directory holding the spool segments.
+        api_responses (list): JSON responses from the weather API.
+        segment_max_bytes (int): Size after which a new segment file is started.
+
+    Returns:
+        int: Number of records appended.
+    """
+    spool_dir = Path(spool_dir)
+    spool_dir.mkdir(parents=True, exist_ok=True)
+
+    with _spool_lock(spool_dir, APPEND_LOCK_FILE, blocking=True):
+        sequences = _list_segments(spool_dir)
+        if sequences:
+            sequence = sequences[-1]
+            _repair_tail(_segment_path(spool_dir, sequence))
+        else:
+            # Start past the checkpointed segment so its stored offset never applies to new data.
+            sequence = read_checkpoint(spool_dir)[0] + 1
+
+        segment_path = _segment_path(spool_dir, sequence)
+        if segment_path.exists() and segment_path.stat().st_size >= segment_max_bytes:
+            sequence += 1
+            segment_path = _segment_path(spool_dir, sequence)
+
+        with open(segment_path, "ab") as segment:
+            for api_response in api_responses:
+                segment.write(json.dumps(api_response, separators=(",", ":")).encode("utf-8") + b"\n")
+            segment.flush()
+            os.fsync(segment.fileno())
+        _fsync_directory(spool_dir)
+
+    logging.info(f"Appended {len(api_responses)} records to spool segment {segment_path.name}.")
+    return len(api_responses)
+
+def read_pending(spool_dir):
+    """
+    Yields the spooled records that have not yet been acknowledged, in the order they were written.
+
+    Records that cannot be decoded are logged and yielded as None so the checkpoint can move past them.
+
+    Args:
+        spool_dir (Path): Directory holding the spool segments.
+
+    Yields:
+        tuple: (segment sequence, byte offset after the record, decoded API response or None).
+    """
+    checkpoint_sequence, checkpoint_offset = read_checkpoint(spool_dir)
+    for sequence in _list_segments(spool_dir):
+        if sequence < checkpoint_sequence:
+            continue
+        offset = checkpoint_offset if sequence == checkpoint_sequence else 0
+        with open(_segment_path(spool_dir, sequence), "rb") as segment:
+            segment.seek(offset)
+            for line in segment:
+                if not line.endswith(b"\n"):
+                    # Incomplete record from an interrupted write; stop here.
+                    break
+                offset += len(line)
+                try:
+                    api_response = json.loads(line)
+                except ValueError as e:
+                    logging.error(f"Skipping corrupt record in spool segment {sequence}: {e}")
+                    api_response = None
+                yield sequence, offset, api_response
+
+def _remove_acknowledged_segments(spool_dir, checkpoint_sequence):
+    """
+    Deletes segments that lie entirely before the checkpoint.
+
+    Args:
+        spool_dir (Path): Directory holding the spool segments.
+        checkpoint_sequence (int): Segment sequence number stored in the checkpoint.
+    """
+    for sequence in _list_segments(spool_dir):
+        if sequence < checkpoint_sequence:
+            _segment_path(spool_dir, sequence).unlink()
+            logging.info(f"Removed acknowledged spool segment {sequence}.")
+
+async def drain_spool(spool_dir, session, batch_size):
+    """
+    Inserts all unacknowledged spooled records into the database in batches.
+
+    The checkpoint is advanced only after each batch has been committed, so records from a batch that
+    failed, or from a run that was interrupted, are replayed on the next call. Replayed rows that are
+    already in the database are ignored, and rows the database rejects are logged and skipped so they
+    cannot block the spool. Only one process drains the spool at a time; if another one holds the drain
+    lock, the call returns immediately.
+
+    Args:
+        spool_dir (str or Path): Directory holding the spool segments.
+        session (AsyncSession): The SQLAlchemy asynchronous session used for database operations.
+        batch_size (int): Maximum number of records inserted per transaction.
+
+    Returns:
+        int or None: Number of records written to the database, or None if another process is draining.
+
+    Raises:
+        Exception: Any exception raised while committing a batch; the batch stays in the spool.
+    """
+    spool_dir = Path(spool_dir)
+    if not spool_dir.exists():
+        return 0
+
+    with _spool_lock(spool_dir, DRAIN_LOCK_FILE, blocking=False) as acquired:
+        if not acquired:
+            logging.warning("Another process is draining the spool, skipping drain.")
+            return None
+
+        inserted = 0
+        batch = []
+        position = None
+
+        async def commit_batch():
+            nonlocal inserted
+            if batch:
+                written = await insert_weather_batch(batch, session)
+                inserted += written
+                logging.info(f"Inserted {written} of {len(batch)} spooled weather records in batch.")
+                batch.clear()
+            await asyncio.to_thread(write_checkpoint, spool_dir, *position)
+
+        for sequence, offset, api_response in read_pending(spool_dir):
+            position = (sequence, offset)
+            if api_response is None:
+                continue
+            try:
+                batch.append(extract_weather_data(api_response))
+            except (KeyError, IndexError, TypeError) as e:
+                logging.error(f"Skipping spooled response that is not valid weather data: {e}")
+                continue
+            if len(batch) >= batch_size:
+                await commit_batch()
+
+        if position is not None:
+            await commit_batch()
+            await asyncio.to_thread(_remove_acknowledged_segments, spool_dir, position[0])
+
+        return inserted